@@ -2,9 +2,13 @@ import asyncio
 import websockets
 import aiohttp
 import configparser
+import ijson
+import zlib
 from pathlib import Path
 import json
-from dataclasses import dataclass
+import os
+from dataclasses import dataclass, replace
+from typing import AsyncIterator
 
 @dataclass
 class Config:
@@ -12,30 +16,77 @@ class Config:
     event_code: str
     outbound_host: str
     api_key: str
+    compression: str = "gzip"
+    embedded: bool = False
+    embedded_port: int = 8000
 
 CONFIG_FILE = "config.ini"
+TEAM_ITEM_PREFIX = "teamList.teams.item"
+MATCH_ITEM_PREFIX = "matchList.matches.item"
+COMPRESSIONS = ("gzip", "zstd")
 
-async def initialize(config: Config):
+async def stream_dump(config: Config) -> AsyncIterator[bytes]:
+    """
+    Stream-parses the full event dump, yielding one newline delimited JSON record per team and match.
+    """
     dump_url = f"http://{config.inbound_host}/api/v2/events/testevent/full/"
-    init_url = f"{config.outbound_host}/api/v1/initialize"
     async with aiohttp.ClientSession() as session:
         async with session.get(dump_url) as response:
-            payload = await response.json()
-    team_numbers = [team["number"] for team in payload["teamList"].get("teams", [])]
-    matches = [
-        {
-            "matchName": match["matchBrief"]["matchName"],
-            "matchNumber": match["matchBrief"]["matchNumber"],
-            "field": match["matchBrief"]["field"],
-            "red1": match["matchBrief"]["red"]["team1"],
-            "red2": match["matchBrief"]["red"]["team2"],
-            "blue1": match["matchBrief"]["blue"]["team1"],
-            "blue2": match["matchBrief"]["blue"]["team2"],
-        } for match in payload["matchList"].get("matches", [])
-    ]
-    async with aiohttp.ClientSession(headers={"X-AGENT-KEY": config.api_key}) as session:
+            builder = None
+            async for prefix, event, value in ijson.parse_async(response.content):
+                if builder is None:
+                    if prefix in (TEAM_ITEM_PREFIX, MATCH_ITEM_PREFIX) and event == "start_map":
+                        builder = ijson.ObjectBuilder()
+                    else:
+                        continue
+                builder.event(event, value)
+                if event != "end_map" or prefix not in (TEAM_ITEM_PREFIX, MATCH_ITEM_PREFIX):
+                    continue
+                item = builder.value
+                builder = None
+                if prefix == TEAM_ITEM_PREFIX:
+                    record = {"team": item["number"]}
+                else:
+                    record = {
+                        "match": {
+                            "matchName": item["matchBrief"]["matchName"],
+                            "matchNumber": item["matchBrief"]["matchNumber"],
+                            "field": item["matchBrief"]["field"],
+                            "red1": item["matchBrief"]["red"]["team1"],
+                            "red2": item["matchBrief"]["red"]["team2"],
+                            "blue1": item["matchBrief"]["blue"]["team1"],
+                            "blue2": item["matchBrief"]["blue"]["team2"],
+                        }
+                    }
+                yield json.dumps(record).encode() + b"\n"
+
+async def compress(records: AsyncIterator[bytes], encoding: str) -> AsyncIterator[bytes]:
+    """
+    Compresses a stream of records with gzip or zstd.
+    """
+    if encoding == "zstd":
+        from compression import zstd
+        compressor = zstd.ZstdCompressor()
+    elif encoding == "gzip":
+        compressor = zlib.compressobj(wbits=31)
+    else:
+        raise ValueError(f"Unsupported compression: {encoding}")
+    async for record in records:
+        chunk = compressor.compress(record)
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+async def initialize(config: Config):
+    init_url = f"{config.outbound_host}/api/v1/initialize"
+    headers = {
+        "X-AGENT-KEY": config.api_key,
+        "Content-Type": "application/x-ndjson",
+        "Content-Encoding": config.compression,
+    }
+    async with aiohttp.ClientSession(headers=headers) as session:
         try:
-            async with session.post(init_url, json={"teams": team_numbers, "matches": matches}) as response:
+            async with session.post(init_url, data=compress(stream_dump(config), config.compression)) as response:
                 if response.status != 200:
                     print(f"POST to {init_url} gave invalid code: {response.status}")
         except Exception as e:
@@ -73,6 +124,26 @@ async def listen(config: Config):
         except Exception as e:
             print(f"WebSocket error: {e}")
 
+async def run_embedded(config: Config):
+    """
+    Runs the API in this process on the local database and forwards events to it over loopback.
+    """
+    os.environ["AGENT_API_KEY"] = config.api_key
+    import uvicorn
+    from ftc_queueing_api import app
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=config.embedded_port))
+    serve = asyncio.create_task(server.serve())
+    while not server.started:
+        if serve.done():
+            print("Embedded API failed to start")
+            return
+        await asyncio.sleep(0.1)
+    try:
+        await listen(replace(config, outbound_host=f"http://127.0.0.1:{config.embedded_port}"))
+    finally:
+        server.should_exit = True
+        await serve
+
 def load_config(config_file: str = CONFIG_FILE) -> Config:
     config = configparser.ConfigParser()
     path = Path(config_file)
@@ -84,12 +155,20 @@ def load_config(config_file: str = CONFIG_FILE) -> Config:
     code = config["inbound"]["code"]
     outbound = config["outbound"]["host"]
     api_key = config["outbound"]["apikey"]
-    return Config(host, code, outbound, api_key)
+    compression = config["outbound"].get("compression", "gzip")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unsupported compression {compression}, expected one of {COMPRESSIONS}")
+    embedded = config.getboolean("embedded", "enabled", fallback=False)
+    embedded_port = config.getint("embedded", "port", fallback=8000)
+    return Config(host, code, outbound, api_key, compression, embedded, embedded_port)
 
 def main():
     config = load_config()
     # asyncio.run(initialize(config))
-    asyncio.run(listen(config))
+    if config.embedded:
+        asyncio.run(run_embedded(config))
+    else:
+        asyncio.run(listen(config))
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,9 @@
 from fastapi import FastAPI, Depends, HTTPException, Security, Request, Response, Body
 from fastapi.security.api_key import APIKeyHeader
-from starlette.status import HTTP_403_FORBIDDEN
+from starlette.datastructures import Headers
+from starlette.status import HTTP_403_FORBIDDEN, HTTP_422_UNPROCESSABLE_CONTENT
+from pydantic import ValidationError
+from sqlalchemy import update as sa_update
 from sqlmodel import Session, SQLModel, create_engine, select, delete
 from .models import (
     AgentUpdatePayload,
@@ -8,11 +11,13 @@ from .models import (
     Team,
     SendMessagePayload,
     AgentInitializePayload,
+    InitializeRecord,
     MatchData,
 )
+import asyncio
 import json
 from typing import Any
-from time import sleep
+from time import sleep, time
 from contextlib import asynccontextmanager
 from .discord import (
     verify_signature,
@@ -22,8 +27,14 @@ from .discord import (
     create_team_role,
     send_message,
     delete_team_role,
+    admit_interaction,
 )
 from datetime import datetime
+from .database import add_missing_columns, create_database_engine
+from .leader import LeaderElector
+from .scheduler import QueueScheduler
+from .streaming import iter_body, iter_lines
+from .sync import CloudSync
 from . import config
 import logging
 
@@ -42,14 +53,32 @@ admin_api_key_header = APIKeyHeader(
 
 sql_uri = config.SQL_URI
 
-engine = create_engine(sql_uri, echo=True)
+engine = create_database_engine(sql_uri)
 
-QUEUE_LOOK_FORWARD = 3
-QUEUE_MESSAGE_TEMPLATES = [
-    "{teams}, match {match} is next on field {field}!",
-    "{teams}, match {match} is queueing on field {field}!",
-    "{teams}, match {match} is queueing on field {field}!",
-]
+# Only the lease holder runs singleton background workers; all replicas serve HTTP
+elector = LeaderElector(
+    engine, "background-workers", config.INSTANCE_ID, config.LEADER_LEASE_SECONDS
+)
+
+# Embedded mode: copy local data to the hosted database off the critical path
+cloud_sync: CloudSync | None = None
+if config.CLOUD_SQL_URI:
+    cloud_sync = CloudSync(
+        engine,
+        create_engine(config.CLOUD_SQL_URI, pool_pre_ping=True),
+        config.CLOUD_SYNC_SECONDS,
+    )
+    elector.register("cloud-sync", cloud_sync.run)
+
+INITIALIZE_CHUNK_SIZE = 100
+
+# Only ticks on the lease holder, see run_scheduler
+scheduler = QueueScheduler(
+    config.QUEUE_LEAD_SECONDS,
+    config.QUEUE_DEFAULT_CYCLE_SECONDS,
+    config.QUEUE_CYCLE_WINDOW,
+    time(),
+)
 
 
 async def get_agent_api_key(api_key_header: str = Security(agent_api_key_header)):
@@ -70,36 +99,118 @@ async def get_admin_api_key(api_key_header: str = Security(admin_api_key_header)
         )
 
 
+def read_schedule() -> tuple[list[MatchData], dict[int, int]]:
+    with Session(engine) as session:
+        matches = list(session.exec(select(MatchData)).all())
+        teams = session.exec(select(Team)).all()
+        return matches, {team.team_number: team.discord_role_id for team in teams}
+
+
+def load_schedule() -> None:
+    """
+    Loads matches, observed starts and team roles into the in-memory queue scheduler.
+    """
+    scheduler.load(*read_schedule())
+
+
+def claim_matches(match_numbers: list[int]) -> list[int]:
+    """
+    Records matches as queued, returning only those not already queued.
+
+    Each claim is a conditional update, so if two replicas briefly both think
+    they lead, only one of them sends each notification.
+    """
+    claimed = []
+    with Session(engine) as session:
+        for number in match_numbers:
+            result = session.exec(
+                sa_update(MatchData)
+                .where(MatchData.matchNumber == number)  # type: ignore[arg-type]
+                .where(MatchData.has_queued == False)  # type: ignore[arg-type]
+                .values(has_queued=True)
+            )
+            if result.rowcount == 1:
+                claimed.append(number)
+        session.commit()
+    return claimed
+
+
+async def run_scheduler():
+    """
+    Ticks the queue scheduler and sends due notifications.
+
+    Ticks never touch the database. The schedule is reloaded every
+    QUEUE_REFRESH_SECONDS to pick up starts received by other replicas.
+    Matches are claimed before sending, so a new leader will not ping them again.
+    """
+    refreshed_at = 0.0
+    while True:
+        if time() - refreshed_at >= config.QUEUE_REFRESH_SECONDS:
+            scheduler.load(*await asyncio.to_thread(read_schedule))
+            refreshed_at = time()
+        due = scheduler.tick(time())
+        if due:
+            try:
+                claimed = await asyncio.to_thread(claim_matches, due)
+                scheduler.mark_queued(due)
+                if claimed:
+                    await asyncio.to_thread(
+                        send_message, scheduler.format_notification(claimed)
+                    )
+            except Exception as e:
+                logging.error(f"Failed to send queue notification: {e}")
+        await asyncio.sleep(scheduler.wheel.tick_seconds)
+
+
+# Queue pings must only be sent once, so they run on the lease holder
+if config.QUEUE_NOTIFICATIONS:
+    elector.register("queue-scheduler", run_scheduler)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     SQLModel.metadata.create_all(engine)
+    add_missing_columns(engine, SQLModel.metadata)
+    if cloud_sync is not None:
+        # Before the agent initializes, so existing team roles are reused
+        try:
+            await asyncio.to_thread(cloud_sync.seed_teams)
+        except Exception as e:
+            logging.warning(f"Could not seed teams from the cloud database: {e}")
     register_global_commands()
+    load_schedule()
+    await elector.start()
     yield
+    await elector.stop()
 
 
 app = FastAPI(lifespan=lifespan)
 
 
-@app.post("/api/v1/initialize")
-async def initialize(
-    payload: AgentInitializePayload, api_key: str = Depends(get_agent_api_key)
-):
+def save_initialize_chunk(teams: list[int], matches: list[MatchData]) -> None:
     """
-    Intakes initial payload from FTC Scoring system agent.
+    Creates roles for new teams and upserts matches from part of the initial payload.
     """
     with Session(engine) as session:
         session.add(
             DebugLogs(
-                event="scoring", payload=json.dumps(payload.model_dump(mode="json"))
+                event="scoring",
+                payload=json.dumps(
+                    AgentInitializePayload(teams=teams, matches=matches).model_dump(
+                        mode="json"
+                    )
+                ),
             )
         )
         session.commit()
-        for team_number in payload.teams:
+        for team_number in teams:
             team = session.get(Team, team_number)
             if not team:
                 role_id = create_team_role(team_number)
                 session.add(Team(team_number=team_number, discord_role_id=role_id))
-        for match in payload.matches:
+                # Don't hold the write lock while waiting on Discord for the next role
+                session.commit()
+        for match in matches:
             result = session.get(MatchData, (match.matchNumber))
             if result is None:
                 result = match
@@ -109,6 +220,44 @@ async def initialize(
         session.commit()
 
 
+@app.post("/api/v1/initialize")
+async def initialize(request: Request, api_key: str = Depends(get_agent_api_key)):
+    """
+    Intakes initial payload from FTC Scoring system agent.
+
+    Expects newline delimited InitializeRecord JSON, optionally gzip or zstd
+    compressed, which is saved in chunks as it streams in. A single
+    AgentInitializePayload JSON body from older agents is also accepted.
+    """
+    try:
+        if request.headers.get("content-type", "").startswith("application/json"):
+            body = b"".join([data async for data in iter_body(request)])
+            payload = AgentInitializePayload.model_validate_json(body)
+            await asyncio.to_thread(
+                save_initialize_chunk, payload.teams, payload.matches
+            )
+        else:
+            teams: list[int] = []
+            matches: list[MatchData] = []
+            async for line in iter_lines(request):
+                record = InitializeRecord.model_validate_json(line)
+                if record.team is not None:
+                    teams.append(record.team)
+                if record.match is not None:
+                    matches.append(record.match)
+                if len(teams) + len(matches) >= INITIALIZE_CHUNK_SIZE:
+                    await asyncio.to_thread(save_initialize_chunk, teams, matches)
+                    teams, matches = [], []
+            if teams or matches:
+                await asyncio.to_thread(save_initialize_chunk, teams, matches)
+    except ValidationError as e:
+        raise HTTPException(
+            status_code=HTTP_422_UNPROCESSABLE_CONTENT,
+            detail=json.loads(e.json(include_input=False)),
+        )
+    load_schedule()
+
+
 @app.post("/api/v1/update")
 async def update(
     payload: dict[str, Any] = Body(...), api_key: str = Depends(get_agent_api_key)
@@ -121,46 +270,23 @@ async def update(
         session.commit()
     parsed_payload = AgentUpdatePayload(**payload)
     if parsed_payload.updateType == "MATCH_START":
+        started_at = datetime.now()
         with Session(engine) as session:
-            matches = session.exec(
-                select(MatchData)
-                .where(MatchData.matchNumber >= parsed_payload.payload.number)
-                .order_by(MatchData.matchNumber)  # type: ignore[arg-type]
-                .limit(1 + QUEUE_LOOK_FORWARD)
-            ).all()
-            started_match = matches[0]
-            if len(matches) == 1 or started_match.has_pinged:
-                logging.info("No upcoming matches to queue. Skip ping.")
+            started_match = session.get(MatchData, parsed_payload.payload.number)
+            if started_match is not None:
+                # Persists the start so whichever replica leads can predict from it
                 started_match.has_pinged = True
+                started_match.started_at = started_at
+                started_match.start_update_time = parsed_payload.updateTime
                 session.add(started_match)
                 session.commit()
-                return
-            next_matches = matches[1:]
-            all_teams = []
-            for match in next_matches:
-                all_teams.extend([match.red1, match.red2, match.blue1, match.blue2])
-            team_data = session.exec(
-                select(Team).where(Team.team_number.in_(all_teams))  # type: ignore[attr-defined]
-            ).all()
-            team_discord_map = {
-                team.team_number: team.discord_role_id for team in team_data
-            }
-            messages = []
-            for template, match in zip(QUEUE_MESSAGE_TEMPLATES, next_matches):
-                messages.append(
-                    template.format(
-                        teams=", ".join(
-                            f"<@&{team_discord_map[tn]}>"
-                            for tn in [match.red1, match.red2, match.blue1, match.blue2]
-                        ),
-                        match=match.matchName,
-                        field=match.field,
-                    )
-                )
-            send_message("\n".join(messages))
-            started_match.has_pinged = True
-            session.add(started_match)
-            session.commit()
+        if elector.is_leader:
+            scheduler.observe_start(
+                parsed_payload.payload.number,
+                parsed_payload.payload.field,
+                parsed_payload.updateTime,
+                started_at.timestamp(),
+            )
     return
 
 
@@ -175,6 +301,20 @@ async def ping(api_key: str = Depends(get_agent_api_key)):
     return "OK"
 
 
+def log_discord_interaction(body: str, headers: Headers) -> None:
+    # Log for debugging
+    with Session(engine) as session:
+        session.add(
+            DebugLogs(event="discord", payload=body, headers=json.dumps(dict(headers)))
+        )
+        session.commit()
+
+
+def handle_command(payload: dict[str, Any]) -> dict[str, Any]:
+    with Session(engine) as session:
+        return parse_command(session, payload)
+
+
 @app.post("/api/v1/discord")
 async def discord(request: Request, response: Response):
     """
@@ -182,25 +322,26 @@ async def discord(request: Request, response: Response):
     """
     body = str(await request.body(), "utf-8")
     headers = request.headers
-    # Log for debugging
-    with Session(engine) as session:
-        session.add(
-            DebugLogs(event="discord", payload=body, headers=json.dumps(dict(headers)))
-        )
-        session.commit()
     # Verify is from Discord
     if not verify_signature(body, headers):
         logging.error("Signature verification failed")
+        log_discord_interaction(body, headers)
         response.status_code = 401
         return "Bad request signature"
     payload = json.loads(body)
+    # Throttled users are answered immediately without touching the database
+    if payload["type"] == 2:
+        rejection = admit_interaction(payload)
+        if rejection is not None:
+            return rejection
+    log_discord_interaction(body, headers)
     # Discord Ping
     if payload["type"] == 1:
         return {"type": 1}
     # Command Sent
     if payload["type"] == 2:
-        with Session(engine) as session:
-            return parse_command(session, payload)
+        # Runs in a thread so queue notifications can be sent while it waits
+        return await asyncio.to_thread(handle_command, payload)
     # Other methods we're not handling
     return {
         "type": 4,
@@ -214,29 +355,48 @@ async def discord(request: Request, response: Response):
 
 
 # === Admin Routes ===
-@app.post("/api/v1/admin/register_teams")
-async def register(payload: list[int], api_key: str = Depends(get_admin_api_key)):
-    """
-    Registers teams to ensure they have Discord Roles
-
-    Returns dict with "skipped" and "created" lists of team numbers.
-    Skipped indicates the role already existed.
-    """
+def register_teams(team_numbers: list[int]) -> dict[str, list[int]]:
     skipped = []
     created = []
     with Session(engine) as session:
-        for team_number in payload:
+        for team_number in team_numbers:
             team = session.get(Team, team_number)
             if team:
                 skipped.append(team_number)
             if not team:
                 role_id = create_team_role(team_number)
                 session.add(Team(team_number=team_number, discord_role_id=role_id))
+                session.commit()
                 created.append(team_number)
-        session.commit()
     return {"skipped": skipped, "created": created}
 
 
+def delete_teams_and_matches() -> None:
+    with Session(engine) as session:
+        for team in session.exec(select(Team)).all():
+            delete_team_role(team.discord_role_id)
+            session.delete(team)
+            session.commit()
+            sleep(0.5)  # To avoid hitting rate limits
+        session.exec(delete(MatchData))
+        session.commit()
+
+
+# Discord calls wait on the shared rate limiter, so they run in threads to
+# keep the event loop free for interactions and the queue scheduler
+@app.post("/api/v1/admin/register_teams")
+async def register(payload: list[int], api_key: str = Depends(get_admin_api_key)):
+    """
+    Registers teams to ensure they have Discord Roles
+
+    Returns dict with "skipped" and "created" lists of team numbers.
+    Skipped indicates the role already existed.
+    """
+    result = await asyncio.to_thread(register_teams, payload)
+    load_schedule()
+    return result
+
+
 @app.post("/api/v1/admin/reset")
 async def reset(api_key: str = Depends(get_admin_api_key)):
     """
@@ -244,13 +404,10 @@ async def reset(api_key: str = Depends(get_admin_api_key)):
 
     Could take multiple attempts if Discord rate limits.
     """
-    with Session(engine) as session:
-        for team in session.exec(select(Team)).all():
-            delete_team_role(team.discord_role_id)
-            sleep(0.5)  # To avoid hitting rate limits
-            session.delete(team)
-        session.exec(delete(MatchData))
-        session.commit()
+    await asyncio.to_thread(delete_teams_and_matches)
+    if cloud_sync is not None:
+        await asyncio.to_thread(cloud_sync.record_reset)
+    scheduler.reset()
     return "OK"
 
 
@@ -278,7 +435,7 @@ async def debug_send_message(
     """
     Admin debug command to send arbitrary message to Discord channel.
     """
-    resp = send_message(payload.content)
+    resp = await asyncio.to_thread(send_message, payload.content)
     return {"body": resp.text, "status_code": resp.status_code}
 
 
@@ -302,3 +459,40 @@ async def debug_agent_ping(api_key: str = Depends(get_admin_api_key)):
             "last_message_time": int(result.time.timestamp()),
             "seconds_since_last_message": time_diff,
         }
+
+
+@app.post("/api/v1/diagnostics/leader")
+async def debug_leader(api_key: str = Depends(get_admin_api_key)):
+    """
+    Gets which replica currently holds the background worker lease
+    """
+    lease = elector.get_lease()
+    return {
+        "instance_id": elector.instance_id,
+        "is_leader": elector.is_leader,
+        "lease_holder": lease.holder if lease else None,
+        "lease_expires_at": int(lease.expires_at.timestamp()) if lease else None,
+    }
+
+
+@app.post("/api/v1/diagnostics/schedule")
+async def debug_schedule(api_key: str = Depends(get_admin_api_key)):
+    """
+    Gets estimated cycle times and predicted start times of upcoming matches
+    """
+    if not elector.is_leader:
+        load_schedule()
+    fields = sorted({match.field for match in scheduler.matches.values()})
+    upcoming = {}
+    for number, match in sorted(scheduler.matches.items()):
+        if number <= scheduler.last_started:
+            continue
+        predicted = scheduler.predict_start(match)
+        upcoming[match.matchName] = int(predicted) if predicted is not None else None
+    return {
+        "is_leader": elector.is_leader,
+        "last_started": scheduler.last_started,
+        "cycle_seconds": {field: scheduler.cycle_time(field) for field in fields},
+        "predicted_starts": upcoming,
+        "notified": sorted(scheduler.notified),
+    }
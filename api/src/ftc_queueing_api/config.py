@@ -1,4 +1,5 @@
-from os import environ as env
+from os import environ as env, getpid
+from socket import gethostname
 
 DISCORD_TOKEN: str = env.get("DISCORD_TOKEN", "your-discord-token-here")
 DISCORD_APPLICATION_ID: int = int(
@@ -16,3 +17,31 @@ DISCORD_NOTIFICATION_CHANNEL_ID: int = int(
 AGENT_API_KEY: str = env.get("AGENT_API_KEY", "supersecretagentapikey")
 ADMIN_API_KEY: str = env.get("ADMIN_API_KEY", "supersecretadminapikey")
 SQL_URI: str = env.get("SQL_URI", "sqlite:///database.db")
+
+INSTANCE_ID: str = env.get("INSTANCE_ID", f"{gethostname()}-{getpid()}")
+LEADER_LEASE_SECONDS: int = int(env.get("LEADER_LEASE_SECONDS", "15"))
+
+QUEUE_LEAD_SECONDS: int = int(env.get("QUEUE_LEAD_SECONDS", "600"))
+QUEUE_DEFAULT_CYCLE_SECONDS: int = int(env.get("QUEUE_DEFAULT_CYCLE_SECONDS", "480"))
+QUEUE_CYCLE_WINDOW: int = int(env.get("QUEUE_CYCLE_WINDOW", "5"))
+# Disable on the hosted API while an embedded venue API sends notifications
+QUEUE_NOTIFICATIONS: bool = env.get("QUEUE_NOTIFICATIONS", "true").lower() == "true"
+# How often the leader reloads the schedule and starts seen by other replicas
+QUEUE_REFRESH_SECONDS: int = int(env.get("QUEUE_REFRESH_SECONDS", "5"))
+
+# Maximum number of replicas, as each enforces its own share of the budgets below
+API_REPLICAS: int = int(env.get("API_REPLICAS", "1"))
+# Per-user and global limits on Discord interactions (tokens/second, burst)
+INTERACTION_USER_RATE: float = float(env.get("INTERACTION_USER_RATE", "0.2"))
+INTERACTION_USER_BURST: int = int(env.get("INTERACTION_USER_BURST", "3"))
+INTERACTION_GLOBAL_RATE: float = float(env.get("INTERACTION_GLOBAL_RATE", "10"))
+INTERACTION_GLOBAL_BURST: int = int(env.get("INTERACTION_GLOBAL_BURST", "20"))
+# Budget for all requests the bot sends to Discord, below its global rate limit
+DISCORD_SEND_RATE: float = float(env.get("DISCORD_SEND_RATE", "40"))
+DISCORD_SEND_BURST: int = int(env.get("DISCORD_SEND_BURST", "40"))
+
+SQLITE_SYNCHRONOUS: str = env.get("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS: int = int(env.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# Set when running alongside the agent to copy local data to the hosted database
+CLOUD_SQL_URI: str = env.get("CLOUD_SQL_URI", "")
+CLOUD_SYNC_SECONDS: int = int(env.get("CLOUD_SYNC_SECONDS", "10"))
@@ -0,0 +1,53 @@
+import logging
+from typing import Any
+from sqlalchemy import Engine, MetaData, event, inspect, text
+from sqlalchemy.schema import CreateColumn
+from sqlmodel import create_engine
+from . import config
+
+
+def set_sqlite_pragmas(dbapi_connection: Any, connection_record: Any) -> None:
+    """
+    Tunes SQLite for fast local writes.
+
+    WAL lets readers continue during writes, and synchronous=NORMAL only syncs
+    at checkpoints, which is still safe against corruption in WAL mode.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+
+def create_database_engine(uri: str, echo: bool = True) -> Engine:
+    engine = create_engine(uri, echo=echo)
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", set_sqlite_pragmas)
+    return engine
+
+
+def add_missing_columns(engine: Engine, metadata: MetaData) -> None:
+    """
+    Adds model columns missing from existing tables, as create_all only creates
+    missing tables.
+
+    New columns must be nullable or have a server default.
+    """
+    inspector = inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                definition = CreateColumn(column).compile(dialect=engine.dialect)
+                logging.info(f"Adding column {column.name} to {table.name}")
+                connection.execute(
+                    text(
+                        f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {definition}"
+                    )
+                )
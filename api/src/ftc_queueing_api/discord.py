@@ -6,11 +6,47 @@ from random import randint
 from pydantic import Json
 from sqlmodel import Session
 from . import config
+from .throttle import KeyedTokenBuckets, PriorityRateLimiter, TokenBucket
 import logging
 from starlette.datastructures import Headers
 
 DISCORD_API_BASE = "https://discord.com/api/v10"
 
+# Lower numbers are sent to Discord first
+PRIORITY_NOTIFICATION = 0
+PRIORITY_COMMAND = 1
+PRIORITY_ADMIN = 2
+# Interactions must be answered within 3 seconds
+COMMAND_SEND_TIMEOUT = 2.0
+EPHEMERAL_FLAG = 64
+
+
+def replica_share(budget: float) -> float:
+    """
+    Share of a bot-wide budget for this replica, as limiters are not shared.
+    """
+    return budget / config.API_REPLICAS
+
+
+def replica_burst(burst: int) -> int:
+    return max(1, burst // config.API_REPLICAS)
+
+
+# Priority only orders requests sent from this replica
+discord_limiter = PriorityRateLimiter(
+    replica_share(config.DISCORD_SEND_RATE),
+    replica_burst(config.DISCORD_SEND_BURST),
+)
+# Not split, as that would leave each user almost no burst. A user whose
+# commands reach several replicas may get up to API_REPLICAS times their limit
+user_interaction_limiter = KeyedTokenBuckets(
+    config.INTERACTION_USER_RATE, config.INTERACTION_USER_BURST
+)
+global_interaction_limiter = TokenBucket(
+    replica_share(config.INTERACTION_GLOBAL_RATE),
+    replica_burst(config.INTERACTION_GLOBAL_BURST),
+)
+
 
 def verify_signature(body: str, headers: Headers):
     """Verify that the request came from Discord"""
@@ -103,6 +139,7 @@ def create_team_role(team_number: int) -> int:
 
     Returns Role ID.
     """
+    discord_limiter.acquire(PRIORITY_ADMIN)
     resp = requests.post(
         f"{DISCORD_API_BASE}/guilds/{config.DISCORD_SERVER_ID}/roles",
         json={
@@ -126,6 +163,7 @@ def delete_team_role(role_id: int) -> None:
 
     Returns Role ID.
     """
+    discord_limiter.acquire(PRIORITY_ADMIN)
     resp = requests.delete(
         f"{DISCORD_API_BASE}/guilds/{config.DISCORD_SERVER_ID}/roles/{role_id}",
         headers=get_discord_api_headers(),
@@ -150,6 +188,8 @@ def set_team(session: Session, team_number: int, user_id: int) -> dict[str, Json
                 "allowed_mentions": {"parse": []},
             },
         }
+    if not discord_limiter.acquire(PRIORITY_COMMAND, COMMAND_SEND_TIMEOUT):
+        return slow_down_response("The bot is busy sending queue notifications.")
     resp = requests.put(
         f"{DISCORD_API_BASE}/guilds/{config.DISCORD_SERVER_ID}/members/{user_id}/roles/{team.discord_role_id}",
         headers=get_discord_api_headers(),
@@ -188,6 +228,8 @@ def unset_team(session: Session, team_number: int, user_id: int) -> dict[str, Js
                 "allowed_mentions": {"parse": []},
             },
         }
+    if not discord_limiter.acquire(PRIORITY_COMMAND, COMMAND_SEND_TIMEOUT):
+        return slow_down_response("The bot is busy sending queue notifications.")
     resp = requests.delete(
         f"{DISCORD_API_BASE}/guilds/{config.DISCORD_SERVER_ID}/members/{user_id}/roles/{team.discord_role_id}",
         headers=get_discord_api_headers(),
@@ -218,6 +260,7 @@ def get_role_ping(role_id: int) -> str:
 
 
 def send_message(content: str) -> requests.Response:
+    discord_limiter.acquire(PRIORITY_NOTIFICATION)
     return requests.post(
         f"{DISCORD_API_BASE}/channels/{config.DISCORD_NOTIFICATION_CHANNEL_ID}/messages",
         json={"content": content, "tts": False},
@@ -225,12 +268,45 @@ def send_message(content: str) -> requests.Response:
     )
 
 
-def parse_command(session: Session, payload: dict[str, Json]) -> dict[str, Json]:
-    user_id = int(
+def get_user_id(payload: dict[str, Json]) -> int:
+    return int(
         payload["member"]["user"]["id"]
         if "member" in payload
         else payload["user"]["id"]
     )
+
+
+def slow_down_response(reason: str) -> dict[str, Json]:
+    """
+    Ephemeral reply shown only to the user who sent the command.
+    """
+    return {
+        "type": 4,
+        "data": {
+            "tts": False,
+            "content": f"Slow down! {reason} Please try again in a few seconds.",
+            "embeds": [],
+            "allowed_mentions": {"parse": []},
+            "flags": EPHEMERAL_FLAG,
+        },
+    }
+
+
+def admit_interaction(payload: dict[str, Json]) -> dict[str, Json] | None:
+    """
+    Applies per-user then global throttling to a command interaction.
+
+    Returns a slow down reply if the interaction should be rejected, else None.
+    """
+    if not user_interaction_limiter.try_acquire(get_user_id(payload)):
+        return slow_down_response("You are sending commands too quickly.")
+    if not global_interaction_limiter.try_acquire():
+        return slow_down_response("The bot is handling too many commands.")
+    return None
+
+
+def parse_command(session: Session, payload: dict[str, Json]) -> dict[str, Json]:
+    user_id = get_user_id(payload)
     match payload["data"]["name"]:
         case "setteam":
             team_number = int(
@@ -0,0 +1,177 @@
+import asyncio
+import logging
+from contextlib import suppress
+from datetime import datetime, timedelta
+from time import monotonic
+from typing import Any, Callable, Coroutine
+from sqlalchemy import Engine, or_
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, update
+from .models import LeaderLease
+
+Worker = Callable[[], Coroutine[Any, Any, None]]
+
+
+class LeaderElector:
+    """
+    Lease-based leader election stored in the shared SQL database.
+
+    Every replica serves HTTP, but only the replica holding the lease runs the
+    registered singleton workers. The holder renews the lease three times per
+    lease period. If it stops renewing, another replica takes over once the
+    lease expires, and a holder whose renewal hangs past its own deadline
+    stops its workers before that can happen.
+    """
+
+    def __init__(self, engine: Engine, name: str, instance_id: str, lease_seconds: int):
+        self.engine = engine
+        self.name = name
+        self.instance_id = instance_id
+        self.lease_seconds = lease_seconds
+        self.is_leader = False
+        self._workers: dict[str, Worker] = {}
+        self._worker_tasks: dict[str, asyncio.Task[None]] = {}
+        self._task: asyncio.Task[None] | None = None
+        self._renewal: asyncio.Future[bool] | None = None
+        # Local time the lease is known to be held until, from the last renewal
+        self._lease_deadline = 0.0
+
+    def register(self, name: str, worker: Worker) -> None:
+        """
+        Registers a coroutine function to run only while this replica leads.
+        """
+        self._workers[name] = worker
+
+    def try_acquire(self) -> bool:
+        """
+        Acquires or renews the lease.
+
+        Returns True if this replica holds the lease afterwards.
+        """
+        now = datetime.now()
+        expires_at = now + timedelta(seconds=self.lease_seconds)
+        with Session(self.engine) as session:
+            if session.get(LeaderLease, self.name) is None:
+                session.add(
+                    LeaderLease(
+                        name=self.name, holder=self.instance_id, expires_at=expires_at
+                    )
+                )
+                try:
+                    session.commit()
+                    return True
+                except IntegrityError:
+                    # Another replica created the lease first
+                    session.rollback()
+                    return False
+            result = session.exec(
+                update(LeaderLease)
+                .where(LeaderLease.name == self.name)  # type: ignore[arg-type]
+                .where(
+                    or_(
+                        LeaderLease.holder == self.instance_id,  # type: ignore[arg-type]
+                        LeaderLease.expires_at < now,  # type: ignore[arg-type]
+                    )
+                )
+                .values(holder=self.instance_id, expires_at=expires_at)
+            )
+            session.commit()
+            return bool(result.rowcount == 1)
+
+    def release(self) -> None:
+        """
+        Expires the lease if held so another replica can take over immediately.
+        """
+        with Session(self.engine) as session:
+            session.exec(
+                update(LeaderLease)
+                .where(LeaderLease.name == self.name)  # type: ignore[arg-type]
+                .where(LeaderLease.holder == self.instance_id)  # type: ignore[arg-type]
+                .values(expires_at=datetime.now())
+            )
+            session.commit()
+
+    def get_lease(self) -> LeaderLease | None:
+        with Session(self.engine) as session:
+            return session.get(LeaderLease, self.name)
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        # Cancelling does not stop the renewal thread, so wait for it to commit
+        if self._renewal is not None:
+            await asyncio.gather(self._renewal, return_exceptions=True)
+        await self._stop_workers()
+        self.is_leader = False
+        # The last renewal may have won the lease, so release even if not leader
+        await asyncio.to_thread(self.release)
+
+    async def _run(self) -> None:
+        while True:
+            started = monotonic()
+            self._renewal = asyncio.ensure_future(asyncio.to_thread(self.try_acquire))
+            try:
+                leader = await asyncio.wait_for(
+                    asyncio.shield(self._renewal), self._time_until_expiry()
+                )
+            except TimeoutError:
+                logging.error(
+                    f"{self.instance_id} could not renew leader lease {self.name} "
+                    "before it expired"
+                )
+                await self._step_down()
+                # Wait out the hung renewal rather than piling up threads
+                await asyncio.gather(self._renewal, return_exceptions=True)
+                continue
+            except Exception as e:
+                logging.error(f"Failed to renew leader lease: {e}")
+                leader = False
+            if leader:
+                # The database expiry was computed after started, so this is safe
+                self._lease_deadline = started + self.lease_seconds
+                if not self.is_leader:
+                    logging.info(
+                        f"{self.instance_id} acquired leader lease {self.name}"
+                    )
+                self.is_leader = True
+                self._start_workers()
+            elif self.is_leader:
+                logging.warning(f"{self.instance_id} lost leader lease {self.name}")
+                await self._step_down()
+            await asyncio.sleep(self.lease_seconds / 3)
+
+    def _time_until_expiry(self) -> float | None:
+        """
+        Seconds until the held lease expires, or None if not leading.
+        """
+        if not self.is_leader:
+            return None
+        return max(0.0, self._lease_deadline - monotonic())
+
+    async def _step_down(self) -> None:
+        self.is_leader = False
+        await self._stop_workers()
+
+    def _start_workers(self) -> None:
+        """
+        Starts any registered worker that is not running, restarting crashed ones.
+        """
+        for name, worker in self._workers.items():
+            task = self._worker_tasks.get(name)
+            if task is not None and not task.done():
+                continue
+            if task is not None and not task.cancelled() and task.exception():
+                logging.error(f"Worker {name} crashed: {task.exception()}")
+            self._worker_tasks[name] = asyncio.create_task(worker())
+
+    async def _stop_workers(self) -> None:
+        for task in self._worker_tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks.values(), return_exceptions=True)
+        self._worker_tasks.clear()
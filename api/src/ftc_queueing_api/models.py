@@ -29,6 +29,11 @@ class MatchData(SQLModel, table=True):
     blue1: int
     blue2: int
     has_pinged: bool = Field(default=False)
+    # Observed start, so the leader can rebuild predictions after failover
+    started_at: datetime | None = Field(default=None)
+    start_update_time: int | None = Field(default=None, sa_column=Column(BIGINT))
+    # Server default so the column can be added to existing tables
+    has_queued: bool = Field(default=False, sa_column_kwargs={"server_default": "0"})
 
 
 class AgentInitializePayload(BaseModel):
@@ -36,6 +41,15 @@ class AgentInitializePayload(BaseModel):
     matches: list[MatchData]
 
 
+class InitializeRecord(BaseModel):
+    """
+    One line of the streamed initial payload from the agent
+    """
+
+    team: int | None = None
+    match: MatchData | None = None
+
+
 class UpdateMatchPayload(BaseModel):
     """
     Inner data about a match from FTC Scoring System Websocket
@@ -71,3 +85,25 @@ class Team(SQLModel, table=True):
 
     team_number: int = Field(primary_key=True)
     discord_role_id: int = Field(sa_column=Column(BIGINT))
+
+
+class LeaderLease(SQLModel, table=True):
+    """
+    Lease held by the replica currently running singleton background workers
+    """
+
+    name: str = Field(primary_key=True)
+    holder: str
+    expires_at: datetime
+
+
+class SyncCursor(SQLModel, table=True):
+    """
+    Cloud sync progress, in microseconds since the epoch.
+
+    Either the time of the last DebugLogs row copied to the cloud database, or
+    of the last reset, which is applied to the cloud until their positions match.
+    """
+
+    name: str = Field(primary_key=True)
+    position: int = Field(default=0, sa_column=Column(BIGINT))
@@ -0,0 +1,268 @@
+import logging
+from collections import deque
+from dataclasses import dataclass
+from math import ceil
+from statistics import median
+from typing import Iterable
+from .models import MatchData
+
+QUEUE_MESSAGE_TEMPLATE = "{teams}, match {match} is queueing on field {field}!"
+
+
+@dataclass
+class FieldAnchor:
+    """
+    Most recent match start observed on a field
+    """
+
+    match_number: int
+    started_at: float
+    update_time: int
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel keyed by match number.
+
+    Deadlines further out than one revolution wait extra rounds in their slot,
+    so scheduling and cancelling are O(1) and each tick only visits one slot.
+    """
+
+    def __init__(self, tick_seconds: float, slots: int, now: float):
+        self.tick_seconds = tick_seconds
+        self.slots = slots
+        self._wheel: list[dict[int, int]] = [{} for _ in range(slots)]
+        self._slot_of: dict[int, int] = {}
+        self._cursor = 0
+        self._time = now
+
+    def schedule(self, key: int, deadline: float) -> None:
+        """
+        Schedules key to fire at deadline, replacing any existing timer for it.
+        """
+        self.cancel(key)
+        ticks = max(1, ceil((deadline - self._time) / self.tick_seconds))
+        slot = (self._cursor + ticks) % self.slots
+        self._wheel[slot][key] = (ticks - 1) // self.slots
+        self._slot_of[key] = slot
+
+    def cancel(self, key: int) -> None:
+        slot = self._slot_of.pop(key, None)
+        if slot is not None:
+            del self._wheel[slot][key]
+
+    def clear(self) -> None:
+        for slot in self._wheel:
+            slot.clear()
+        self._slot_of.clear()
+
+    def advance(self, now: float) -> list[int]:
+        """
+        Advances the wheel up to now.
+
+        Returns keys whose deadline has passed.
+        """
+        due = []
+        while self._time + self.tick_seconds <= now:
+            self._time += self.tick_seconds
+            self._cursor = (self._cursor + 1) % self.slots
+            slot = self._wheel[self._cursor]
+            for key, rounds in list(slot.items()):
+                if rounds == 0:
+                    del slot[key]
+                    del self._slot_of[key]
+                    due.append(key)
+                else:
+                    slot[key] = rounds - 1
+        return due
+
+
+class QueueScheduler:
+    """
+    Predicts match start times from observed cycle times and queues teams
+    a fixed lead time before their match.
+
+    Timer ticks only use in-memory state. Observed starts and sent
+    notifications are persisted on MatchData, so loading the schedule from the
+    database rebuilds the same predictions on any replica.
+    """
+
+    def __init__(
+        self,
+        lead_seconds: float,
+        default_cycle_seconds: float,
+        cycle_window: int,
+        now: float,
+    ):
+        self.lead_seconds = lead_seconds
+        self.default_cycle_seconds = default_cycle_seconds
+        self.cycle_window = cycle_window
+        self.matches: dict[int, MatchData] = {}
+        self.team_roles: dict[int, int] = {}
+        self.notified: set[int] = set()
+        # Notified, but not yet recorded as queued in the database
+        self.in_flight: set[int] = set()
+        self.last_started = 0
+        self.wheel = TimerWheel(1.0, 4096, now)
+        self._anchors: dict[int, FieldAnchor] = {}
+        self._cycles: dict[int, deque[float]] = {}
+
+    def load(self, matches: Iterable[MatchData], team_roles: dict[int, int]) -> None:
+        """
+        Replaces the match schedule and team role map, and rebuilds cycle times
+        from the persisted match starts.
+
+        Matches already marked as pinged are treated as started.
+        """
+        self.matches = {match.matchNumber: match for match in matches}
+        self.team_roles = team_roles
+        self._anchors.clear()
+        self._cycles.clear()
+        for number, match in sorted(self.matches.items()):
+            if match.started_at is not None and match.start_update_time is not None:
+                self._record_start(
+                    number,
+                    match.field,
+                    match.start_update_time,
+                    match.started_at.timestamp(),
+                )
+        self.last_started = max(
+            (match.matchNumber for match in self.matches.values() if match.has_pinged),
+            default=0,
+        )
+        self.notified = {
+            number
+            for number, match in self.matches.items()
+            if match.has_queued or number in self.in_flight
+        }
+        self.reschedule()
+
+    def reset(self) -> None:
+        """
+        Forgets all observed starts, e.g. when moving to a new event.
+        """
+        self.notified.clear()
+        self.in_flight.clear()
+        self.load([], {})
+
+    def cycle_time(self, field: int) -> float:
+        """
+        Rolling median of recent start-to-start times on a field.
+        """
+        samples = self._cycles.get(field)
+        if not samples:
+            return self.default_cycle_seconds
+        return median(samples)
+
+    def observe_start(
+        self, match_number: int, field: int, update_time: int, now: float
+    ) -> None:
+        """
+        Records a MATCH_START and re-predicts every pending match.
+        """
+        self._record_start(match_number, field, update_time, now)
+        self.last_started = max(self.last_started, match_number)
+        self.reschedule()
+
+    def _record_start(
+        self, match_number: int, field: int, update_time: int, now: float
+    ) -> None:
+        """
+        Updates the field's anchor and cycle samples.
+
+        Cycle times come from scoring system timestamps, while the anchor uses
+        local time so predictions line up with the timer wheel clock.
+        """
+        previous = self._anchors.get(field)
+        if previous is not None and match_number > previous.match_number:
+            # Spread the interval over any starts on this field that were missed
+            matches_between = (
+                sum(
+                    1
+                    for number, other in self.matches.items()
+                    if other.field == field
+                    and previous.match_number < number <= match_number
+                )
+                or 1
+            )
+            cycle = (update_time - previous.update_time) / 1000 / matches_between
+            if cycle > 0:
+                samples = self._cycles.setdefault(
+                    field, deque(maxlen=self.cycle_window)
+                )
+                samples.append(cycle)
+        self._anchors[field] = FieldAnchor(match_number, now, update_time)
+
+    def predict_start(self, match: MatchData) -> float | None:
+        """
+        Predicts the local start time of a match, or None before any match has started.
+        """
+        anchor = self._anchors.get(match.field)
+        if anchor is not None:
+            remaining = sum(
+                1
+                for number, other in self.matches.items()
+                if other.field == match.field
+                and anchor.match_number < number <= match.matchNumber
+            )
+            return anchor.started_at + remaining * self.cycle_time(match.field)
+        if not self._anchors:
+            return None
+        # Field has not started yet, so space matches evenly across all fields
+        latest = max(self._anchors.values(), key=lambda a: a.started_at)
+        fields = len({other.field for other in self.matches.values()}) or 1
+        spacing = self.cycle_time(match.field) / fields
+        return latest.started_at + (match.matchNumber - latest.match_number) * spacing
+
+    def reschedule(self) -> None:
+        self.wheel.clear()
+        for number, match in self.matches.items():
+            if number <= self.last_started or number in self.notified:
+                continue
+            predicted = self.predict_start(match)
+            if predicted is not None:
+                self.wheel.schedule(number, predicted - self.lead_seconds)
+
+    def tick(self, now: float) -> list[int]:
+        """
+        Advances the timer wheel.
+
+        Returns the numbers of matches now due for a queue notification.
+        """
+        due = sorted(
+            number
+            for number in self.wheel.advance(now)
+            if number > self.last_started and number not in self.notified
+        )
+        self.notified.update(due)
+        self.in_flight.update(due)
+        return due
+
+    def mark_queued(self, match_numbers: list[int]) -> None:
+        """
+        Called once due matches are recorded as queued in the database.
+        """
+        self.in_flight.difference_update(match_numbers)
+
+    def format_notification(self, match_numbers: list[int]) -> str:
+        messages = []
+        for number in match_numbers:
+            match = self.matches[number]
+            messages.append(
+                QUEUE_MESSAGE_TEMPLATE.format(
+                    teams=", ".join(
+                        self.format_team(team)
+                        for team in [match.red1, match.red2, match.blue1, match.blue2]
+                    ),
+                    match=match.matchName,
+                    field=match.field,
+                )
+            )
+        logging.info(f"Queueing matches {match_numbers}")
+        return "\n".join(messages)
+
+    def format_team(self, team_number: int) -> str:
+        role_id = self.team_roles.get(team_number)
+        if role_id is None:
+            return f"Team {team_number}"
+        return f"<@&{role_id}>"
@@ -0,0 +1,129 @@
+import zlib
+from compression import zstd
+from typing import AsyncIterator, Iterator
+from fastapi import HTTPException, Request
+from starlette.status import (
+    HTTP_400_BAD_REQUEST,
+    HTTP_413_CONTENT_TOO_LARGE,
+    HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+)
+
+MAX_LINE_BYTES = 1024 * 1024
+# Most decompressed bytes produced from one chunk at a time
+MAX_OUTPUT_BYTES = 64 * 1024
+
+
+class IdentityDecoder:
+    eof = True
+
+    def decode(self, data: bytes) -> Iterator[bytes]:
+        yield data
+
+
+class GzipDecoder:
+    def __init__(self) -> None:
+        self._decompressor = zlib.decompressobj(wbits=31)
+
+    @property
+    def eof(self) -> bool:
+        return self._decompressor.eof
+
+    def decode(self, data: bytes) -> Iterator[bytes]:
+        while data:
+            yield self._decompressor.decompress(data, MAX_OUTPUT_BYTES)
+            data = self._decompressor.unconsumed_tail
+        if self._decompressor.unused_data:
+            raise zlib.error("Unexpected data after end of stream")
+
+
+class ZstdDecoder:
+    def __init__(self) -> None:
+        self._decompressor = zstd.ZstdDecompressor()
+
+    @property
+    def eof(self) -> bool:
+        return self._decompressor.eof
+
+    def decode(self, data: bytes) -> Iterator[bytes]:
+        yield self._decompressor.decompress(data, MAX_OUTPUT_BYTES)
+        while not self._decompressor.eof and not self._decompressor.needs_input:
+            yield self._decompressor.decompress(b"", MAX_OUTPUT_BYTES)
+
+
+Decoder = IdentityDecoder | GzipDecoder | ZstdDecoder
+
+
+def get_decoder(encoding: str) -> Decoder:
+    """
+    Gets an incremental decoder for a Content-Encoding header value.
+
+    Decoders yield at most MAX_OUTPUT_BYTES at a time, however much a chunk
+    expands.
+    """
+    match encoding:
+        case "" | "identity":
+            return IdentityDecoder()
+        case "gzip":
+            return GzipDecoder()
+        case "zstd":
+            return ZstdDecoder()
+        case _:
+            raise HTTPException(
+                status_code=HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail=f"Unsupported Content-Encoding: {encoding}",
+            )
+
+
+async def iter_body(request: Request) -> AsyncIterator[bytes]:
+    """
+    Yields the decompressed request body as it arrives.
+
+    Corrupt or truncated compressed bodies are rejected with a 400, though
+    anything yielded before the error was found has already been consumed.
+    """
+    encoding = request.headers.get("content-encoding", "").strip().lower()
+    decoder = get_decoder(encoding)
+    async for chunk in request.stream():
+        if not chunk:
+            continue
+        output = decoder.decode(chunk)
+        while True:
+            try:
+                data = next(output, None)
+            except (zlib.error, zstd.ZstdError, EOFError) as e:
+                raise HTTPException(
+                    status_code=HTTP_400_BAD_REQUEST,
+                    detail=f"Invalid {encoding} body: {e}",
+                )
+            if data is None:
+                break
+            if data:
+                yield data
+    if not decoder.eof:
+        raise HTTPException(
+            status_code=HTTP_400_BAD_REQUEST,
+            detail=f"Truncated {encoding} body",
+        )
+
+
+async def iter_lines(request: Request) -> AsyncIterator[bytes]:
+    """
+    Yields non-empty lines of a newline delimited request body.
+
+    Only one line is buffered at a time, so memory stays bounded however large
+    the body is.
+    """
+    buffer = b""
+    async for data in iter_body(request):
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+        if len(buffer) > MAX_LINE_BYTES:
+            raise HTTPException(
+                status_code=HTTP_413_CONTENT_TOO_LARGE,
+                detail="Line too long",
+            )
+    if buffer.strip():
+        yield buffer
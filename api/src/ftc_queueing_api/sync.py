@@ -0,0 +1,165 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any
+from sqlalchemy import Engine, inspect
+from sqlmodel import Session, SQLModel, delete, select
+from .database import add_missing_columns
+from .models import DebugLogs, MatchData, SyncCursor, Team
+
+SYNCED_MODELS: list[type[SQLModel]] = [Team, MatchData]
+DEBUG_LOGS_CURSOR = "debuglogs"
+RESET_CURSOR = "reset"
+EPOCH = datetime(1970, 1, 1)
+
+
+class CloudSync:
+    """
+    Copies teams, matches and debug logs from the local database to the hosted
+    database in the background, so the venue never waits on its uplink.
+
+    Teams and matches are compared against what was last pushed and only
+    changed rows are sent. Cloud rows are never deleted because they are
+    missing locally, only when a local reset has not yet been applied to the
+    cloud. Debug logs are appended in batches after a cursor stored in the
+    cloud database. Failed syncs are retried on the next run.
+    """
+
+    def __init__(
+        self,
+        local_engine: Engine,
+        cloud_engine: Engine,
+        interval_seconds: int,
+        batch_size: int = 500,
+    ):
+        self.local_engine = local_engine
+        self.cloud_engine = cloud_engine
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self._synced: dict[tuple[str, Any], dict[str, Any]] = {}
+        self._tables_created = False
+
+    def create_cloud_tables(self) -> None:
+        if not self._tables_created:
+            SQLModel.metadata.create_all(self.cloud_engine)
+            add_missing_columns(self.cloud_engine, SQLModel.metadata)
+            self._tables_created = True
+
+    def sync_once(self) -> None:
+        self.create_cloud_tables()
+        self.sync_rows()
+        self.sync_logs()
+
+    def record_reset(self) -> None:
+        """
+        Marks teams and matches in the cloud for deletion on the next sync,
+        after they were deleted locally.
+
+        Stored in the local database so the reset survives a restart.
+        """
+        with Session(self.local_engine) as local:
+            local.merge(
+                SyncCursor(
+                    name=RESET_CURSOR,
+                    position=(datetime.now() - EPOCH) // timedelta(microseconds=1),
+                )
+            )
+            local.commit()
+
+    def get_pending_reset(self, local: Session, cloud: Session) -> SyncCursor | None:
+        """
+        Gets the local reset if it has not been applied to the cloud yet.
+        """
+        reset = local.get(SyncCursor, RESET_CURSOR)
+        applied = cloud.get(SyncCursor, RESET_CURSOR)
+        if reset is None or (
+            applied is not None and applied.position == reset.position
+        ):
+            return None
+        return reset
+
+    def seed_teams(self) -> None:
+        """
+        Copies teams missing locally from the cloud, so a fresh local database
+        reuses their existing Discord roles instead of creating duplicates.
+
+        Skipped while a reset is pending, as those roles have been deleted.
+        """
+        self.create_cloud_tables()
+        with Session(self.local_engine) as local, Session(self.cloud_engine) as cloud:
+            if self.get_pending_reset(local, cloud) is not None:
+                return
+            seeded = 0
+            for team in cloud.exec(select(Team)).all():
+                if local.get(Team, team.team_number) is None:
+                    local.add(Team(**team.model_dump()))
+                    seeded += 1
+            local.commit()
+        logging.info(f"Seeded {seeded} teams from the cloud database")
+
+    def sync_rows(self) -> None:
+        with Session(self.local_engine) as local, Session(self.cloud_engine) as cloud:
+            current = {}
+            for model in SYNCED_MODELS:
+                for row in local.exec(select(model)).all():
+                    key = (model.__name__, inspect(row).identity)  # type: ignore[union-attr]
+                    current[key] = (model, row.model_dump())
+            reset = self.get_pending_reset(local, cloud)
+            if reset is not None:
+                # Replace the cloud's rows with the local ones in one transaction
+                for model in SYNCED_MODELS:
+                    cloud.exec(delete(model))
+                cloud.merge(SyncCursor(name=RESET_CURSOR, position=reset.position))
+                self._synced = {}
+            changed = {
+                key: value
+                for key, value in current.items()
+                if self._synced.get(key) != value[1]
+            }
+            if not changed and reset is None:
+                return
+            for model, data in changed.values():
+                cloud.merge(model(**data))
+            cloud.commit()
+        for key, (_, data) in changed.items():
+            self._synced[key] = data
+        logging.info(
+            f"Synced {len(changed)} changed rows"
+            + (", after clearing the cloud for a reset" if reset is not None else "")
+        )
+
+    def sync_logs(self) -> None:
+        with Session(self.cloud_engine) as cloud:
+            cursor = cloud.get(SyncCursor, DEBUG_LOGS_CURSOR) or SyncCursor(
+                name=DEBUG_LOGS_CURSOR
+            )
+            with Session(self.local_engine) as local:
+                logs = local.exec(
+                    select(DebugLogs)
+                    .where(
+                        DebugLogs.time > EPOCH + timedelta(microseconds=cursor.position)
+                    )
+                    .order_by(DebugLogs.time, DebugLogs.id)  # type: ignore[arg-type]
+                    .limit(self.batch_size)
+                ).all()
+            if not logs:
+                return
+            if len(logs) == self.batch_size:
+                # Leave logs sharing the last timestamp for the next batch, as
+                # the cursor would skip any of them cut off by the limit
+                logs = [log for log in logs if log.time < logs[-1].time] or logs
+            for log in logs:
+                # The cloud assigns its own IDs, as it also logs Discord requests
+                cloud.add(DebugLogs(**log.model_dump(exclude={"id"})))
+            # Committed with the logs, so a batch is never copied twice
+            cursor.position = (logs[-1].time - EPOCH) // timedelta(microseconds=1)
+            cloud.add(cursor)
+            cloud.commit()
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.sync_once)
+            except Exception as e:
+                logging.warning(f"Cloud sync failed, will retry: {e}")
+            await asyncio.sleep(self.interval_seconds)
@@ -0,0 +1,116 @@
+import heapq
+import threading
+from itertools import count
+from time import monotonic
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilling at rate tokens per second up to capacity.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def try_acquire(self) -> bool:
+        """
+        Takes a token if one is available without waiting.
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def time_until_available(self) -> float:
+        """
+        Seconds until a token is available, 0 if one is available now.
+        """
+        with self._lock:
+            self._refill()
+            return max(0.0, (1 - self._tokens) / self.rate)
+
+    def is_full(self) -> bool:
+        with self._lock:
+            self._refill()
+            return self._tokens >= self.capacity
+
+
+class KeyedTokenBuckets:
+    """
+    Independent token buckets per key, e.g. per Discord user.
+
+    Buckets that have refilled completely hold no state worth keeping, so they
+    are dropped once more than max_keys are tracked.
+    """
+
+    def __init__(self, rate: float, capacity: float, max_keys: int = 10000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets: dict[int, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, key: int) -> bool:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._buckets = {
+                        k: b for k, b in self._buckets.items() if not b.is_full()
+                    }
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+        return bucket.try_acquire()
+
+
+class PriorityRateLimiter:
+    """
+    Token bucket shared between threads where waiters with a lower priority
+    number are always served first.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self._bucket = TokenBucket(rate, capacity)
+        self._condition = threading.Condition()
+        self._waiting: list[tuple[int, int]] = []
+        self._sequence = count()
+
+    def acquire(self, priority: int, timeout: float | None = None) -> bool:
+        """
+        Waits for a token behind any higher priority waiters.
+
+        Returns False if no token was granted within timeout seconds.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        entry = (priority, next(self._sequence))
+        with self._condition:
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    wait = None
+                    if self._waiting[0] == entry:
+                        wait = self._bucket.time_until_available()
+                        if wait <= 0 and self._bucket.try_acquire():
+                            return True
+                    if deadline is not None:
+                        remaining = deadline - monotonic()
+                        if remaining <= 0:
+                            return False
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._condition.wait(wait)
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
@@ -158,13 +158,24 @@ resource "google_cloud_run_service" "api" {
             google_sql_database.api-db.name,
           google_sql_database_instance.tavern-sql-instance.connection_name)
         }
+        env {
+          // Discord rate budgets are split between replicas
+          name  = "API_REPLICAS"
+          value = var.max_instances
+        }
+        env {
+          name  = "QUEUE_NOTIFICATIONS"
+          value = var.queue_notifications
+        }
       }
     }
 
     metadata {
       annotations = {
         "autoscaling.knative.dev/minScale"      = 1
-        "autoscaling.knative.dev/maxScale"      = 1
+        "autoscaling.knative.dev/maxScale"      = var.max_instances
+        // Background workers run outside of requests on the leader replica
+        "run.googleapis.com/cpu-throttling"     = false
         "run.googleapis.com/cloudsql-instances" = google_sql_database_instance.tavern-sql-instance.connection_name
         "run.googleapis.com/client-name"        = "terraform"
         "run.googleapis.com/sessionAffinity"    = true
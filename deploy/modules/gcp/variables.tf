@@ -90,3 +90,15 @@ variable "discord_notifiation_channel_id" {
   sensitive   = true
   description = "Discord Notification ID"
 }
+
+variable "max_instances" {
+  type        = number
+  description = "Maximum number of API replicas. Background workers only run on the elected leader."
+  default     = 1
+}
+
+variable "queue_notifications" {
+  type        = bool
+  description = "Whether the hosted API sends queue notifications. Disable while a venue runs in embedded mode."
+  default     = true
+}